@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import multiprocessing
+import yaml
+import diff
+from diff import analyze_section, triage_section, new_entry, get_read_tools, UNFINISHED_STOP_REASONS
+from rfc_index import handle_doc, load_section_text
+from query_repo_recursive import build_index, use_index
+from init import get_config, set_config, setup_logging
+from section_cache import load_section_cache, save_section_cache, lookup_section, record_section
+
+# === Shared state ===
+# Built once in the parent process; forked workers inherit the parsed
+# indexes, source buffers and summaries instead of rebuilding them.
+jobs = []
+indexes = {}    # project_path -> project_data
+summaries = {}  # summary_json -> code summary tree
+
+# Files each job writes on its own; two jobs must never share one
+JOB_FILES = ("output", "section_cache", "rfc_cleaned_output", "rfc_section_index")
+
+def check_job_files(jobs):
+    owners = {}
+    for job in jobs:
+        for key in JOB_FILES:
+            path = os.path.abspath(job[key])
+            if path in owners:
+                raise ValueError(f"Jobs '{owners[path]}' and '{job['name']}' both write {path}; give them distinct names or {key} settings")
+            owners[path] = job["name"]
+
+def load_manifest(manifest_file):
+    with open(manifest_file, "r") as f:
+        manifest = yaml.safe_load(f)
+
+    protocols = [job["protocol"] for job in manifest["jobs"]]
+    for job_id, job in enumerate(manifest["jobs"]):
+        job.setdefault("prefer_path", job["project_path"])
+        # Jobs sharing a protocol (e.g. several versions of one stack) get distinct default names
+        job.setdefault("name", job["protocol"] if protocols.count(job["protocol"]) == 1 else f"{job['protocol']}_{job_id}")
+        job.setdefault("output", f"inconsistencies_{job['name']}.json")
+        job.setdefault("section_cache", f"section_cache_{job['name']}.json")
+        if isinstance(job["rfc_inputs"], str):
+            job["rfc_inputs"] = [job["rfc_inputs"]]
+        rfc_directory = os.path.dirname(job["rfc_inputs"][0])
+        job.setdefault("rfc_cleaned_output", os.path.join(rfc_directory, f"cleaned_{job['name']}.txt"))
+        job.setdefault("rfc_section_index", os.path.join(rfc_directory, f"cleaned_{job['name']}_sections.json"))
+        # Only the scheduler writes reports; workers return their entries
+        job["config"] = get_config().with_project(
+            protocol=job["protocol"],
+            project_path=job["project_path"],
+            prefer_path=job["prefer_path"],
+            summary_json=job["summary_json"],
+            section_cache=job["section_cache"],
+            output=None,
+            **{key: job[key] for key in ("programming_language", "query_socket") if key in job}
+        )
+    check_job_files(manifest["jobs"])
+    return manifest
+
+def activate_job(job):
+    set_config(job["config"])
+    use_index(indexes[job["project_path"]])
+
+def save_job(job, entries):
+    with open(job["output"], "w", encoding="utf-8") as f_json:
+        json.dump([entry for entry in entries if entry is not None], f_json, indent=2)
+
+# === Worker ===
+def run_section(task):
+    job_id, position, section = task
+    job = jobs[job_id]
+    activate_job(job)
+    diff.json_entries = []
+    try:
+        reads = analyze_section(section, summaries[job["summary_json"]])
+    except Exception as e:
+        print(f"⚠️ Section analysis failed for {job['name']}: {e}")
+        # Keep the section in the report; the failure is not cached
+        return job_id, position, section, new_entry(section, "", stop_reason=f"analysis failed: {e}"), None
+    return job_id, position, section, diff.json_entries[-1], reads
+
+# === Scheduler ===
+def run_batch(manifest_file):
+    manifest = load_manifest(manifest_file)
+    jobs.extend(manifest["jobs"])
+    concurrency = manifest.get("concurrency", os.cpu_count())
+
+    for job in jobs:
+        if job["project_path"] not in indexes:
+            set_config(job["config"])
+            if job["config"].query_socket:
+                # Lookups go to the query server; no local index is needed
+                indexes[job["project_path"]] = None
+            else:
+                print(f"Start scanning project {job['project_path']}...")
+                indexes[job["project_path"]] = build_index(job["project_path"])
+        if job["summary_json"] not in summaries:
+            with open(job["summary_json"]) as f:
+                summaries[job["summary_json"]] = json.load(f)
+
+    caches = {}
+    results = []
+    tasks = []
+    for job_id, job in enumerate(jobs):
+        activate_job(job)
+        if job["section_cache"] not in caches:
+            caches[job["section_cache"]] = load_section_cache(job["section_cache"])
+        cache = caches[job["section_cache"]]
+
+        sections = handle_doc(job["rfc_inputs"], job["rfc_cleaned_output"], job["rfc_section_index"])
+
+        entries = [None] * len(sections)
+        results.append(entries)
+        for position, section in enumerate(sections):
+            cached = lookup_section(cache, section["hash"], get_read_tools())
+            if cached is not None:
+                entries[position] = {**cached, "RFC chunk ID": section["id"], "section hash": section["hash"]}
+                continue
+            reason = triage_section(load_section_text(section))
+            if reason:
+                entries[position] = new_entry(section, "", stop_reason=reason)
+                continue
+            tasks.append((job_id, position, section))
+        save_job(job, entries)
+
+    print(f"Start analyzing {len(tasks)} sections from {len(jobs)} jobs with {concurrency} workers...")
+    with multiprocessing.get_context("fork").Pool(concurrency) as pool:
+        for job_id, position, section, entry, reads in pool.imap_unordered(run_section, tasks):
+            job = jobs[job_id]
+            results[job_id][position] = entry
+            save_job(job, results[job_id])
+            if reads is not None and entry["stop reason"] not in UNFINISHED_STOP_REASONS:
+                record_section(caches[job["section_cache"]], section["hash"], reads, entry)
+                save_section_cache(job["section_cache"], caches[job["section_cache"]])
+    print("Finish analyzing...")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python batch.py manifest.yaml")
+        sys.exit(1)
+    setup_logging(get_config())
+    run_batch(sys.argv[1])
@@ -1,11 +1,25 @@
 import re
-from autogen import ConversableAgent
-import autogen
 import json
 from query_repo_recursive import *
+from section_cache import load_section_cache, save_section_cache, lookup_section, record_section, make_read
+from query_server import get_client, remote_tools
+from rfc_index import handle_doc, load_section_text
+from snippet_store import store_snippet
 from init import *
-import re
-import json
+
+# Report entries of the current run, one per analysed section
+json_entries = []
+
+def save_entries():
+    """
+    Write json_entries to the report file. Batch workers run without one and
+    hand their entries back to the scheduler instead.
+    """
+    json_file = get_config().json_file
+    if not json_file:
+        return
+    with open(json_file, "w", encoding="utf-8") as f_json:
+        json.dump(json_entries, f_json, indent=2)
 
 def write_inconsistency(inconsistency_summary: str, proposed_fix: str):
     """
@@ -27,49 +41,7 @@ def write_inconsistency(inconsistency_summary: str, proposed_fix: str):
     json_entries[-1]["inconsistencies"].append(new_inconsistency)
     
     # Write the updated list back to the JSON file
-    with open(JSON_FILE, "w", encoding="utf-8") as f_json:
-        json.dump(json_entries, f_json, indent=2)
-
-def clean_text(filename):
-    with open(filename, 'r', encoding='utf-8') as file:
-        file_content = file.read()
-
-        header_pattern = re.compile(r'RFC (\d+)\s+(.*?)\s+([A-Za-z]+ \d{4})')
-        footer_pattern = re.compile(r'^.*\s+\[Page \d+\]$', re.MULTILINE)
-
-        text = header_pattern.sub('', file_content)
-        text = footer_pattern.sub('', text)
-
-        text = re.sub(r'\n\s*\n', '\n', text)
-        return text.strip()
-  
-def handle_doc(readfile, writefile):
-    # step 1: clean document
-    document_text = clean_text(readfile)
-
-    with open(writefile, 'w', encoding='utf-8') as cleaned_file:
-        cleaned_file.write(document_text)
-
-    print(f"Cleaned content written to {writefile}")
-
-    # step 2: segmentation to sections
-    # Adjusted regex pattern to capture section numbers more reliably, including standalone section titles
-    section_header_pattern = re.compile(r'^(\d+(?:\.\d+)*)(\.?)\s+(.*)$', re.MULTILINE)
-    
-    headers = list(section_header_pattern.finditer(document_text))
-    sections = []
-
-    for i, match in enumerate(headers):
-        start_index = match.end()
-        end_index = headers[i + 1].start() if (i + 1) < len(headers) else len(document_text)
-        
-        # Extract section number and title, and trim content accurately
-        section_number = match.group(1)
-        section_title = match.group(3).strip()
-        section_content = document_text[start_index:end_index].strip()
-        sections.append(section_number + section_title + '\n' + section_content)
-
-    return sections
+    save_entries()
 
 # === similar with -ls, return the files/directories under this level ===
 def navigate_one_level(node):
@@ -84,6 +56,12 @@ def navigate_one_level(node):
     return "\n".join(result)
 
 # === Recursive multi-path explorer ===
+def is_path_reply(response):
+    return "TERMINATE" in response.upper() or re.search(r"\[(.*?)\]", response) is not None
+
+def is_function_reply(response):
+    return re.search(r"\[(.*?)\]", response, re.DOTALL) is not None
+
 def explore_multiple_paths(doc_section, current_node, current_path):
     output_paths = []
 
@@ -98,7 +76,7 @@ Which entries are most relevant to this section?
 Return a comma-separated list of file or folder names enclosed in square brackets, e.g., ["file1.c", "subdir"]. Say TERMINATE if nothing matches.
 """
     print(f"Context for LLM:\n{context}\n")
-    response = askLLM(context).strip()
+    response = askLLM(context, accept=is_path_reply).strip()
     if "TERMINATE"in response.upper():
         return []
     # Use regex to extract all quoted names inside the first bracketed list
@@ -152,7 +130,7 @@ Return a list of function names enclosed in square brackets, like ["func1", "fun
     max_retries = 3
     for _ in range(max_retries):
         try:
-            response = askLLM(prompt).strip()
+            response = askLLM(prompt, accept=is_function_reply).strip()
             match = re.search(r"\[(.*?)\]", response, re.DOTALL)
             if not match:
                 print("⚠️ LLM response did not contain a valid list of function names.")
@@ -169,19 +147,65 @@ Return a list of function names enclosed in square brackets, like ["func1", "fun
         except Exception as e:
             continue
 
+# === Triage: cheap checks before an expensive analyze/critic session ===
+# Older RFCs and many non-IETF specs state requirements in lowercase, so the
+# keywords are matched in any case ("must", "must not", "shall", "required to", ...)
+MANDATORY_PATTERN = re.compile(r'\b(must(\s+not)?|shall(\s+not)?|required(\s+to)?)\b', re.IGNORECASE)
+
+def triage_section(doc_section):
+    """
+    Return the reason a section can be skipped without running any LLM, or None.
+    Only explicit violations of mandatory behavior are reported, so a section
+    without any mandatory keyword, in any case, cannot produce a finding.
+    """
+    if get_config().triage_sections and not MANDATORY_PATTERN.search(doc_section):
+        return "no mandatory requirement in section"
+    return None
+
+# Rounds left after the budget runs out for the critic to look up code and record its findings
+FINAL_TURN_ROUNDS = 4
+
+# Verdicts cut short are not reused from the section cache
+UNFINISHED_STOP_REASONS = ("round budget exhausted",)
+
+def initial_round_budget(function_count):
+    config = get_config()
+    return min(config.max_round, config.min_round + config.rounds_per_function * function_count)
+
+def new_entry(section, function, stop_reason="", round_budget=0):
+    return {
+        "RFC chunk ID": section["id"],
+        "section hash": section["hash"],
+        "original context": function,
+        "additional context": [],
+        "inconsistencies": [],
+        "stop reason": stop_reason,
+        "round budget": round_budget
+    }
+
+def skip_section(section, function, reason):
+    global json_entries
+    print(f"⏭️ Skipping section {section['id']}: {reason}")
+    json_entries.append(new_entry(section, function, stop_reason=reason))
+    save_entries()
+
 # === Agent configuration ===
-@retry(wait=wait_random_exponential(min=retry_min, max=retry_max), stop=stop_after_attempt(max_retries))
-def agent_config(function, docsec):
+def agent_config(function, section, round_budget=None):
+    if round_budget is None:
+        round_budget = get_config().max_round
+    return retrying()(run_session, function, section, round_budget)
+
+def run_session(function, section, round_budget):
+    # The agent framework is only loaded by runs that actually start a session
+    from autogen import ConversableAgent
+    import autogen
+
     global json_entries
-    json_entries.append({
-        "RFC chunk ID": docsec,
-        "original context": function,
-        "additional context": "",
-        "inconsistencies": []
-    })
+    config = get_config()
+    config_list = config.config_list
+    json_entries.append(new_entry(section, function, round_budget=round_budget))
     # Write initial version of JSON after adding the entry
-    with open(JSON_FILE, "w", encoding="utf-8") as f_json:
-        json.dump(json_entries, f_json, indent=2)
+    save_entries()
 
     def get_task_prompt(function, docsec):
         task_prompt = f"Find any inconsistencies between the code and its RFC specification. Only report **explicit violations** of documented mandatory behavior.\n The implementation:\n {function}n RFC document: {docsec}"
@@ -268,6 +292,10 @@ Ensure that only **true, explicitly documented** inconsistencies are documented
         system_message= get_critic_prompt(),
         llm_config={"config_list": config_list},
     )
+    tools = get_read_tools()
+    query_name = tools["query_name"]
+    query_caller = tools["query_caller"]
+
     # Register the tool signature with the analyze agent.
     analyze.register_for_llm(name="query_name", description="Query function/macro/type definition")(query_name)
     critic.register_for_llm(name="query_name", description="Query function/macro/type definition")(query_name)
@@ -285,8 +313,45 @@ Ensure that only **true, explicitly documented** inconsistencies are documented
     critic.register_for_llm(name="write_inconsistency", description="Append inconsistency to the JSON file")(write_inconsistency)
     executor.register_for_execution(name="write_inconsistency")(write_inconsistency)
     
+    # Exploration progress: the budget grows while tool calls keep returning
+    # new code, and the session stops once they stall.
+    session = {
+        "budget": round_budget,
+        "seen": set(),
+        "stale": 0,
+        "final turn": None,  # why the critic was asked for a final judgment
+        "stop reason": None
+    }
+
+    def track_progress(messages):
+        calls = messages[-2].get('tool_calls') or []
+        if any(call.get('function', {}).get('name') == "write_inconsistency" for call in calls):
+            return
+        found_new = False
+        for resp in messages[-1].get('tool_responses') or []:
+            content = (resp.get('content') or "").strip()
+            if content and content != "None" and content not in session["seen"]:
+                session["seen"].add(content)
+                found_new = True
+        if found_new:
+            session["stale"] = 0
+            session["budget"] = min(config.max_round, session["budget"] + 2)
+        else:
+            session["stale"] += 1
+            if session["stale"] >= config.stall_limit and not session["final turn"]:
+                print("⚠️ Exploration stalled, asking the critic for a final judgment.")
+                session["final turn"] = "exploration stalled"
+
     def state_transition(last_speaker, groupchat):
         messages = groupchat.messages
+        if len(messages) >= session["budget"] + FINAL_TURN_ROUNDS:
+            session["stop reason"] = "round budget exhausted"
+            return None
+        if len(messages) >= session["budget"] and not session["final turn"]:
+            # Only the critic records findings, so it judges what analyze reported so far
+            print("⚠️ Round budget exhausted, asking the critic for a final judgment.")
+            session["final turn"] = "round budget exhausted"
+
         if last_speaker is initializer:
             return analyze
         
@@ -303,7 +368,10 @@ Ensure that only **true, explicitly documented** inconsistencies are documented
             # return analyze/critic
             if len(messages) < 2:
                  ("Error: unexpected speaker before executor")
+            track_progress(messages)
             if messages[-2]['name'] == 'analyze':
+                if session["final turn"]:
+                    return critic
                 return analyze
             elif messages[-2]['name'] == 'Critic':
                 return critic
@@ -313,28 +381,146 @@ Ensure that only **true, explicitly documented** inconsistencies are documented
         elif last_speaker is critic:
             if 'tool_calls' in messages[-1]:
                 return executor
+            elif session["final turn"]:
+                session["stop reason"] = session["final turn"]
+                return None
             else:
                 return analyze
          
     groupchat = autogen.GroupChat(
         agents = [initializer, analyze, executor, critic],
         messages=[],
-        max_round=30,
+        max_round=config.max_round + FINAL_TURN_ROUNDS,
         speaker_selection_method=state_transition
     )
 
     manager = autogen.GroupChatManager(groupchat=groupchat, llm_config={"config_list": config_list,},is_termination_msg=lambda msg: msg.get("content") is not None and "TERMINATE" in msg["content"] and msg["name"] == "Critic")
-    initializer.initiate_chat(manager, message = get_task_prompt(function, docsec))
+    initializer.initiate_chat(manager, message = get_task_prompt(function, load_section_text(section)))
+
+    last = groupchat.messages[-1] if groupchat.messages else {}
+    if session["stop reason"] is None:
+        if last.get("name") == "Critic" and "TERMINATE" in (last.get("content") or ""):
+            session["stop reason"] = "terminated by critic"
+        else:
+            session["stop reason"] = "round budget exhausted"
+    print(f"🛑 Session ended: {session['stop reason']}")
+    json_entries[-1]["stop reason"] = session["stop reason"]
+    json_entries[-1]["round budget"] = session["budget"]
 
     # After chat → parse groupchat.messages to fill log_entry fields
+    # Each distinct tool response is kept once in the snippet store and referenced by hash
+    additional_context = json_entries[-1]["additional context"]
     for msg in groupchat.messages:
         tool_responses = msg.get('tool_responses', [])
         if tool_responses:
             for resp in tool_responses:
-                json_entries[-1]["additional context"] += resp['content'] + '\n\n'
-    with open(JSON_FILE, "w", encoding="utf-8") as f_json:
-        json.dump(json_entries, f_json, indent=2)
-    return
+                ref = store_snippet(config.snippet_store, resp['content'])
+                if ref not in additional_context:
+                    additional_context.append(ref)
+    save_entries()
+    return collect_tool_reads(groupchat.messages)
+
+# === Code snippets read through tool calls, used to validate cached verdicts ===
+def get_read_tools():
+    """
+    Lookup tools given to the agents and used to replay cached reads: answered
+    by the query server when one is configured, in-process from project_data otherwise.
+    """
+    socket_path = get_config().query_socket
+    if socket_path:
+        return remote_tools(get_client(socket_path))
+    return {
+        "query_function": query_function,
+        "query_function_in_file": query_function_in_file,
+        "query_name": query_name,
+        "query_caller": query_caller,
+    }
+
+def collect_tool_reads(messages):
+    """Record every lookup of the session with the digest of the response the agents got."""
+    read_tools = get_read_tools()
+    calls = {}
+    for msg in messages:
+        for call in msg.get('tool_calls') or []:
+            function = call.get('function', {})
+            if function.get('name') not in read_tools:
+                continue
+            try:
+                args = json.loads(function.get('arguments') or "{}")
+            except json.JSONDecodeError:
+                continue
+            calls[call.get('id')] = (function['name'], args)
+
+    reads = []
+    for msg in messages:
+        for resp in msg.get('tool_responses') or []:
+            call = calls.get(resp.get('tool_call_id'))
+            if call is None:
+                continue
+            tool, args = call
+            reads.append(make_read(tool, args, resp.get('content')))
+    return reads
+
+
+# === Per-section analysis ===
+def analyze_section(section, code_json):
+    """
+    Explore the code summary for one RFC section, select candidate functions and run
+    the analyze/critic session on them. The result is appended to json_entries.
+    Returns the code reads the result depends on, or None if the section was skipped.
+    """
+    doc_section = load_section_text(section)
+    # multiple file paths
+    matches = explore_multiple_paths(doc_section, code_json, current_path=get_config().prefer_path)
+    
+    function_text =""
+    function_metadata = {}
+
+    for match in matches:
+        print("\n✅ Final Match:")
+        print("Path:", match["path"])
+        node = match["node"]
+        path = match["path"]
+
+        # level_view: functions only 
+        for func_name, func in node["functions"].items():
+            function_text += f"🔧 {func_name}: {func.get('summary', '')}\n"
+            function_metadata[func_name] = {
+                "path": path,
+                "start_byte": func.get("start_byte"),
+                "end_byte": func.get("end_byte")
+            }
+
+    # Second LLM pass: choose most relevant functions
+    selected_funcs = select_relevant_functions(doc_section, function_text)
+    if not selected_funcs:
+        print("⚠️ No functions selected.")
+        skip_section(section, "", "no candidate functions")
+        return None
+    print(f"📌 Selected functions for section:")
+    code = ""
+    reads = []
+    for fn in selected_funcs:
+        print(f"  🔧 {fn}")
+        function_info = function_metadata.get(fn)
+        if function_info:
+            # Summary paths are prefer_path + '/' + name; use the index key to share its source buffer
+            path = index_path(function_info["path"])
+            start_byte = function_info["start_byte"]
+            end_byte = function_info["end_byte"]
+            fn_code = read_source(path)[start_byte:end_byte].decode("utf8")
+            code += fn_code.strip() + "\n"
+            # Replayed from the same file, so names defined in several files still hit
+            reads.append(make_read("query_function_in_file", {"function_name": fn, "file_path": path}, fn_code))
+        else:
+            print(f"⚠️ Function {fn} not found in metadata.")
+
+    if not code:
+        skip_section(section, code, "no candidate code")
+        return None
+    
+    reads.extend(agent_config(code, section, initial_round_budget(len(reads))))
+    return reads
 
 
 # === Main function ===
@@ -343,66 +529,40 @@ Ensure that only **true, explicitly documented** inconsistencies are documented
 # It uses the Tree-sitter library to parse the code and identify functions.
 # The function also interacts with an LLM to refine the selection of functions.
 if __name__ == "__main__":
-    json_entries = []
+    config = get_config()
+    setup_logging(config)
+    save_entries()
 
-    with open(JSON_FILE, "w", encoding="utf-8") as f_json:
-        json.dump(json_entries, f_json, indent=2)
-
-    with open(summary_json) as f:  
+    with open(config.summary_json) as f:  
         code_json = json.load(f)
+
+    section_cache = load_section_cache(config.section_cache_file)
         
-    sections = handle_doc(read_file_name, write_file_name)
+    sections = handle_doc(config.rfc_inputs, config.write_file_name, config.section_index_file)
     
-    print("Start scanning project...")
-    init(project_path)
-    print("Finish scanning project...")
+    if config.query_socket:
+        print(f"Using query server at {config.query_socket}")
+    else:
+        print("Start scanning project...")
+        init(config.project_path)
+        print("Finish scanning project...")
     
     print("Start analyzing...")
     for section in sections:
-        print("$$$$$$$ analysis new section:")
-        # multiple file paths
-        matches = explore_multiple_paths(section, code_json, current_path=prefer_path)
-        
-        function_text =""
-        function_metadata = {}
-
-        for match in matches:
-            print("\n✅ Final Match:")
-            print("Path:", match["path"])
-            node = match["node"]
-            path = match["path"]
-
-            # level_view: functions only 
-            for func_name, func in node["functions"].items():
-                function_text += f"🔧 {func_name}: {func.get('summary', '')}\n"
-                function_metadata[func_name] = {
-                    "path": path,
-                    "start_byte": func.get("start_byte"),
-                    "end_byte": func.get("end_byte")
-                }
-
-        # Second LLM pass: choose most relevant functions
-        selected_funcs = select_relevant_functions(section, function_text)
-        if selected_funcs is None:
-            print("⚠️ No functions selected.")
+        print(f"$$$$$$$ analysis new section: {section['id']}")
+        cached = lookup_section(section_cache, section["hash"], get_read_tools())
+        if cached is not None:
+            print("♻️ Code unchanged since last run, reusing cached result.")
+            json_entries.append({**cached, "RFC chunk ID": section["id"], "section hash": section["hash"]})
+            save_entries()
             continue
-        related_funs = set()
-        related_funs.update(selected_funcs)
-        print(f"📌 Selected functions for section:")
-        code = ""
-        for fn in selected_funcs:
-            print(f"  🔧 {fn}")
-            function_info = function_metadata.get(fn)
-            if function_info:
-                path = function_info["path"]
-                start_byte = function_info["start_byte"]
-                end_byte = function_info["end_byte"]
-                with open(path, "rb") as f:
-                    file_content = f.read()
-                    fn_code = file_content[start_byte:end_byte].decode("utf8")
-                    code += fn_code.strip() + "\n"
-            else:
-                print(f"⚠️ Function {fn} not found in metadata.")
-        
-        agent_config(code, section)
-        
\ No newline at end of file
+
+        reason = triage_section(load_section_text(section))
+        if reason:
+            skip_section(section, "", reason)
+            continue
+
+        reads = analyze_section(section, code_json)
+        if reads is not None and json_entries[-1]["stop reason"] not in UNFINISHED_STOP_REASONS:
+            record_section(section_cache, section["hash"], reads, json_entries[-1])
+            save_section_cache(config.section_cache_file, section_cache)
@@ -0,0 +1,171 @@
+import os
+import re
+import subprocess
+from query_repo_recursive import get_parser, is_source_file, index_path, extract_symbols, store_symbols, remove_file, source_buffers
+
+# === Incremental updates from git diffs ===
+# Only files touched in a revision range are reparsed. The tree of the old
+# version (retained, or parsed for its symbols) gets the diff hunks applied
+# with Tree.edit, and tree-sitter reuses every unchanged subtree.
+
+HUNK_PATTERN = re.compile(rb'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@', re.MULTILINE)
+SYMBOL_KINDS = ("functions", "types", "defines")
+
+def git(project_path, *args) -> bytes:
+    return subprocess.run(["git", "-C", project_path, *args], check=True, capture_output=True).stdout
+
+def parse_rev_range(rev_range):
+    """'A..B' compares two commits; a single revision 'A' compares it with the working tree."""
+    if ".." in rev_range:
+        old_rev, new_rev = rev_range.split("..", 1)
+        return old_rev, new_rev or "HEAD"
+    return rev_range, None
+
+def diff_args(old_rev, new_rev):
+    return [old_rev] if new_rev is None else [old_rev, new_rev]
+
+def touched_files(project_path, old_rev, new_rev):
+    """Return the source files changed between the revisions, relative to project_path."""
+    output = git(project_path, "diff", "--name-only", "--no-renames", "--relative", *diff_args(old_rev, new_rev))
+    return [path for path in output.decode("utf8").splitlines() if is_source_file(path)]
+
+def read_revision(project_path, rev, relpath):
+    """Return the content of a file at a revision (None: the working tree), or None if it does not exist there."""
+    if rev is None:
+        file_path = os.path.join(project_path, relpath)
+        if not os.path.isfile(file_path):
+            return None
+        with open(file_path, "rb") as f:
+            return f.read()
+    try:
+        return git(project_path, "show", f"{rev}:./{relpath}")
+    except subprocess.CalledProcessError:
+        return None
+
+def diff_hunks(project_path, old_rev, new_rev, relpath):
+    """Return (old_start, old_count, new_start, new_count) line ranges of each hunk."""
+    output = git(project_path, "diff", "-U0", "--no-color", "--no-ext-diff", "--relative", *diff_args(old_rev, new_rev), "--", relpath)
+    hunks = []
+    for match in HUNK_PATTERN.finditer(output):
+        old_start, old_count, new_start, new_count = match.groups()
+        hunks.append((int(old_start), int(old_count or 1), int(new_start), int(new_count or 1)))
+    return hunks
+
+def line_offsets(content: bytes):
+    offsets = [0]
+    offset = content.find(b"\n")
+    while offset != -1:
+        offsets.append(offset + 1)
+        offset = content.find(b"\n", offset + 1)
+    return offsets
+
+def line_offset(offsets, content, line):
+    return offsets[line] if line < len(offsets) else len(content)
+
+def end_point(start_point, segment: bytes):
+    row, column = start_point
+    newlines = segment.count(b"\n")
+    if newlines == 0:
+        return (row, column + len(segment))
+    return (row + newlines, len(segment) - segment.rfind(b"\n") - 1)
+
+def apply_hunks(tree, old_content, new_content, hunks):
+    """Describe every hunk to tree-sitter, in order, so the old tree lines up with the new content."""
+    old_offsets = line_offsets(old_content)
+    new_offsets = line_offsets(new_content)
+    for old_start, old_count, new_start, new_count in hunks:
+        # With zero context a hunk of count 0 starts after the given line
+        old_line = old_start - 1 if old_count else old_start
+        new_line = new_start - 1 if new_count else new_start
+
+        old_segment = old_content[line_offset(old_offsets, old_content, old_line):line_offset(old_offsets, old_content, old_line + old_count)]
+        new_segment = new_content[line_offset(new_offsets, new_content, new_line):line_offset(new_offsets, new_content, new_line + new_count)]
+
+        # Text before the hunk already matches the new content
+        start_byte = line_offset(new_offsets, new_content, new_line)
+        start_point = (new_line, 0)
+        tree.edit(
+            start_byte=start_byte,
+            old_end_byte=start_byte + len(old_segment),
+            new_end_byte=start_byte + len(new_segment),
+            start_point=start_point,
+            old_end_point=end_point(start_point, old_segment),
+            new_end_point=end_point(start_point, new_segment),
+        )
+
+def symbol_text(content, span):
+    return content[span.start_byte:span.end_byte]
+
+def compare_symbols(file_path, old_content, old_symbols, new_content, new_symbols, changes):
+    for kind in SYMBOL_KINDS:
+        old_table = old_symbols.get(kind, {}) if old_symbols else {}
+        new_table = new_symbols.get(kind, {}) if new_symbols else {}
+        for name, span in new_table.items():
+            if name not in old_table:
+                changes[kind]["added"].append({"file": file_path, "name": name})
+            elif symbol_text(old_content, old_table[name]) != symbol_text(new_content, span):
+                changes[kind]["changed"].append({"file": file_path, "name": name})
+        for name in old_table:
+            if name not in new_table:
+                changes[kind]["removed"].append({"file": file_path, "name": name})
+
+def new_change_set():
+    changes = {kind: {"added": [], "removed": [], "changed": []} for kind in SYMBOL_KINDS}
+    changes["files"] = {"added": [], "removed": [], "modified": []}
+    return changes
+
+def update_index(project_path, rev_range, data=None, trees=None):
+    """
+    Reparse the files touched in rev_range and work out which functions, types
+    and defines were added, removed or changed.
+    :param data: project_data to update in place; without it only the change set is computed
+    :param trees: parse trees of the indexed files, reused through Tree.edit and kept up to date
+    """
+    old_rev, new_rev = parse_rev_range(rev_range)
+    parser = get_parser()
+    changes = new_change_set()
+
+    for relpath in touched_files(project_path, old_rev, new_rev):
+        file_path = index_path(os.path.join(project_path, relpath))
+        old_content = read_revision(project_path, old_rev, relpath)
+        new_content = read_revision(project_path, new_rev, relpath)
+
+        # Symbols of the old version: from the index when it holds exactly that content
+        old_symbols = None
+        old_tree = None
+        if old_content is not None:
+            if data is not None and source_buffers.get(file_path) == old_content and file_path in data["functions"]:
+                old_symbols = {kind: data[kind][file_path] for kind in SYMBOL_KINDS}
+                if trees is not None:
+                    old_tree = trees.get(file_path)
+            else:
+                # Parsed anyway for its symbols, so keep the tree to reparse the new version from
+                old_tree = parser.parse(old_content)
+                old_symbols = extract_symbols(old_content, old_tree)
+
+        new_symbols = None
+        if new_content is not None:
+            if old_tree is not None:
+                apply_hunks(old_tree, old_content, new_content, diff_hunks(project_path, old_rev, new_rev, relpath))
+                tree = parser.parse(new_content, old_tree)
+            else:
+                tree = parser.parse(new_content)
+            new_symbols = extract_symbols(new_content, tree)
+
+        if old_content is None:
+            changes["files"]["added"].append(file_path)
+        elif new_content is None:
+            changes["files"]["removed"].append(file_path)
+        else:
+            changes["files"]["modified"].append(file_path)
+        compare_symbols(file_path, old_content, old_symbols, new_content, new_symbols, changes)
+
+        if data is not None:
+            remove_file(data, file_path, trees)
+            if new_symbols is not None:
+                source_buffers[file_path] = new_content
+                store_symbols(data, file_path, new_symbols)
+                if trees is not None:
+                    trees[file_path] = tree
+
+    return changes
@@ -1,61 +1,140 @@
-from openai import OpenAI
 from tenacity import (
-    retry,
+    Retrying,
     stop_after_attempt,
     wait_random_exponential,
 )
-import yaml
 import sys
+import os
+import hashlib
+
+CONFIG_FILE = "config.yaml"
+
+class Config:
+    """Project, LLM and analysis settings. Nothing is read until a tool asks for it."""
+
+    def __init__(self, config: dict):
+        self.raw = config
+
+        # LLM Configuration
+        llm_config = config["llm_config"]
+        self.model_name = llm_config["model_name"]
+        self.api_key = llm_config["OPENAI_API_KEY"]
+        self.temperature = llm_config["temperature"]
+        self.config_list = [
+            {
+                "model": self.model_name,
+                "api_key": self.api_key,
+                "temperature": self.temperature
+            }
+        ]
+        self.retry_min = llm_config["retry_min"]
+        self.retry_max = llm_config["retry_max"]
+        self.max_retries = llm_config["max_retries"]
+        self.llm_cache_dir = llm_config.get("cache_dir")
+
+        # Project Configuration
+        project = config["project"]
+        self.protocol = project["protocol"]
+        self.log_or_not = project.get("log_or_not", False)
+        self.log_file = project.get("log_file", "log.txt")
+        self.project_path = project["project_path"]
+        self.prefer_path = project["prefer_path"]
+        rfc_input = project.get("rfc_input", [])
+        self.rfc_inputs = [rfc_input] if isinstance(rfc_input, str) else list(rfc_input)
+        self.write_file_name = project.get("rfc_cleaned_output", f"RFC/cleaned_{self.protocol}.txt")
+        self.section_index_file = project.get("rfc_section_index", os.path.splitext(self.write_file_name)[0] + "_sections.json")
+        self.summary_json = project["summary_json"]
+        self.json_file = project.get("output", f"inconsistencies_{self.protocol}.json")
+        self.section_cache_file = project.get("section_cache", f"section_cache_{self.protocol}.json")
+        self.snippet_store = project.get("snippet_store", "snippets")
+        self.programming_language = project.get("programming_language", "c")
+        self.query_socket = project.get("query_socket")
+        self.query_watch_interval = project.get("query_watch_interval", 0)
+        self.query_retain_trees = project.get("query_retain_trees", False)
+
+        # Analysis Configuration
+        analysis_config = config.get("analysis", {})
+        self.triage_sections = analysis_config.get("triage", True)
+        self.min_round = analysis_config.get("min_round", 10)
+        self.max_round = analysis_config.get("max_round", 30)
+        self.rounds_per_function = analysis_config.get("rounds_per_function", 4)
+        self.stall_limit = analysis_config.get("stall_limit", 3)
+
+    @classmethod
+    def load(cls, path=CONFIG_FILE):
+        import yaml
+        with open(path, "r") as f:
+            return cls(yaml.safe_load(f))
+
+    def with_project(self, **overrides):
+        """Return a copy of this configuration with some project settings replaced."""
+        config = dict(self.raw)
+        config["project"] = {**self.raw["project"], **overrides}
+        return Config(config)
+
+_config = None
+
+def get_config() -> Config:
+    global _config
+    if _config is None:
+        _config = Config.load()
+    return _config
+
+def set_config(config: Config):
+    global _config
+    _config = config
+
+def setup_logging(config: Config):
+    if config.log_or_not:
+        # Redirect stdout and stderr to log file
+        sys.stdout = open(config.log_file, 'w', encoding='utf-8')
+        sys.stderr = sys.stdout
+
+def retrying() -> Retrying:
+    config = get_config()
+    return Retrying(wait=wait_random_exponential(min=config.retry_min, max=config.retry_max), stop=stop_after_attempt(config.max_retries))
 
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-
-
-model_name = config["llm_config"]["model_name"]
-OPENAI_API_KEY = config["llm_config"]["OPENAI_API_KEY"]
-temperature = config["llm_config"]["temperature"]
-config_list = [
-    {
-        "model": model_name,
-        "api_key": OPENAI_API_KEY,
-        "temperature": temperature
-    }
-]
-retry_min = config["llm_config"]["retry_min"]
-retry_max = config["llm_config"]["retry_max"]
-max_retries = config["llm_config"]["max_retries"]
-
-@retry(wait=wait_random_exponential(min=retry_min, max=retry_max), stop=stop_after_attempt(max_retries))
 def query(prompt):
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    response = client.chat.completions.create(
-        model=model_name,
-        temperature=temperature,
-        messages=prompt,
-    )
-    return response.choices[0].message.content
-   
-
-def askLLM(prompt):
+    from openai import OpenAI
+
+    config = get_config()
+
+    def create():
+        client = OpenAI(api_key=config.api_key)
+        response = client.chat.completions.create(
+            model=config.model_name,
+            temperature=config.temperature,
+            messages=prompt,
+        )
+        return response.choices[0].message.content
+
+    return retrying()(create)
+
+
+def askLLM(prompt, accept=None):
+    # With llm_config.cache_dir set, answers are cached on disk by prompt, so
+    # runs and batch jobs sharing code and RFC text do not pay for the same
+    # question twice. A reply is cached only if accept(reply) holds, so callers
+    # that parse the reply keep malformed answers out of the cache and get a
+    # fresh one when they retry.
+    config = get_config()
+    cache_path = None
+    if config.llm_cache_dir:
+        key = hashlib.sha256(f"{config.model_name}\n{config.temperature}\n{prompt}".encode("utf8")).hexdigest()
+        cache_path = os.path.join(config.llm_cache_dir, key[:2], key + ".txt")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read()
+
     test_prompt = [
         {"role": "user", "content": prompt},
     ]
     response = query(test_prompt)
-    return response
 
-# Project Configuration
-protocol = config["project"]["protocol"]
-log_file = config["project"]["log_file"]
-project_path = config["project"]["project_path"]
-prefer_path = config["project"]["prefer_path"]
-read_file_name = config["project"]["rfc_input"]
-write_file_name = config["project"]["rfc_cleaned_output"]
-summary_json = config["project"]["summary_json"]
-JSON_FILE = f"inconsistencies_{protocol}.json"
-
-if config["project"].get("log_or_not", False):
-    # Redirect stdout and stderr to log file
-    sys.stdout = open(log_file, 'w', encoding='utf-8')
-    sys.stderr = sys.stdout
-
-programming_language = config["project"].get("programming_language", "c")
\ No newline at end of file
+    if cache_path and response and (accept is None or accept(response)):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(response)
+        os.replace(tmp_path, cache_path)
+    return response
@@ -1,26 +1,84 @@
+from __future__ import annotations
 import os
-import tree_sitter_c as tsc
-import tree_sitter_cpp as tscpp
-import tree_sitter
+import sys
+from array import array
 from collections import deque
-from tree_sitter import Language, Parser
-from typing import List
+from typing import List, TYPE_CHECKING
 from init import *
 
-if programming_language == "c":
-    C_LANGUAGE = Language(tsc.language())
-    parser = Parser(C_LANGUAGE)
-elif programming_language == "cpp":
-    CPP_LANGUAGE = Language(tscpp.language())
-    parser = Parser(CPP_LANGUAGE)
-    print("Using C++ parser")
-
-project_data = {
-    "functions": {},
-    "function_calls": {},
-    "types": {},
-    "defines": {}
-}
+if TYPE_CHECKING:
+    import tree_sitter
+
+# Parsers are created on first use, one per language, so importing this
+# module does not load tree-sitter or any grammar.
+parsers = {}
+
+def get_parser(language=None):
+    if language is None:
+        language = get_config().programming_language
+    if language not in parsers:
+        from tree_sitter import Language, Parser
+        if language == "c":
+            import tree_sitter_c as grammar
+        elif language == "cpp":
+            import tree_sitter_cpp as grammar
+            print("Using C++ parser")
+        else:
+            raise ValueError(f"Unsupported programming language: {language}")
+        parsers[language] = Parser(Language(grammar.language()))
+    return parsers[language]
+
+# project_data maps kind -> file_path -> name -> Span. Parse trees are dropped
+# right after extraction; only byte offsets into the source are kept.
+# "function_calls" maps file_path -> callee id -> array of caller ids, where
+# ids index into symbol_names.
+def new_project_data():
+    return {
+        "functions": {},
+        "function_calls": {},
+        "types": {},
+        "defines": {}
+    }
+
+project_data = new_project_data()
+
+symbol_names = []
+symbol_ids = {}
+
+# Maps file_path -> file content, shared by every index built in this process
+source_buffers = {}
+
+def index_path(file_path: str) -> str:
+    """Key under which a file is indexed: its absolute path, however it was named."""
+    return os.path.abspath(file_path)
+
+def read_source(file_path: str) -> bytes:
+    source_code = source_buffers.get(file_path)
+    if source_code is None:
+        with open(file_path, "rb") as f:
+            source_code = f.read()
+        source_buffers[file_path] = source_code
+    return source_code
+
+class Span:
+    __slots__ = ("start_byte", "end_byte")
+
+    def __init__(self, start_byte: int, end_byte: int):
+        self.start_byte = start_byte
+        self.end_byte = end_byte
+
+def node_span(node: tree_sitter.Node) -> Span:
+    return Span(node.start_byte, node.end_byte)
+
+def intern_name(name: str) -> int:
+    """Return the integer id of a symbol name, adding it to the name table if needed."""
+    symbol_id = symbol_ids.get(name)
+    if symbol_id is None:
+        symbol_id = len(symbol_names)
+        name = sys.intern(name)
+        symbol_names.append(name)
+        symbol_ids[name] = symbol_id
+    return symbol_id
 
 def find_nodes_by_type(
         root_node: tree_sitter.Node, node_type: str
@@ -71,8 +129,8 @@ def find_first_father_by_type(
     return None
 
 def parse_all_function_info(source_code, tree: tree_sitter.Tree):
-    fun_info = {} # Maps function name -> function AST node
-    fun_call_info = {} # Maps called function name -> set of caller names
+    fun_info = {} # Maps function name -> Span of the definition
+    fun_call_info = {} # Maps called function id -> set of caller ids
     
     all_function_nodes = find_nodes_by_type(tree.root_node, "function_definition")
     for node in all_function_nodes:
@@ -83,7 +141,7 @@ def parse_all_function_info(source_code, tree: tree_sitter.Tree):
         for sub_node in dec_node.children:
             if sub_node.type in {"qualified_identifier", "scoped_identifier", "identifier"}:
                 function_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
-                fun_info[function_name] = node
+                fun_info[sys.intern(function_name)] = node_span(node)
                 break
             elif sub_node.type == "field_identifier":
                 function_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
@@ -93,9 +151,10 @@ def parse_all_function_info(source_code, tree: tree_sitter.Tree):
                     if class_name:
                         class_name = source_code[class_name.start_byte:class_name.end_byte].decode("utf8")
                         function_name = f"{class_name}::{function_name}"
-                fun_info[function_name] = node
+                fun_info[sys.intern(function_name)] = node_span(node)
                 break
         if function_name:
+            caller_id = intern_name(function_name)
             call_nodes = find_nodes_by_type(node, "call_expression")
             for call_node in call_nodes:
                 call_fun = call_node.child_by_field_name("function")
@@ -108,9 +167,10 @@ def parse_all_function_info(source_code, tree: tree_sitter.Tree):
                     called_name = call_fun.text.decode("utf8")
                     
                 if called_name:
-                    if called_name not in fun_call_info:
-                        fun_call_info[called_name] = set()
-                    fun_call_info[called_name].add(function_name)
+                    called_id = intern_name(called_name)
+                    if called_id not in fun_call_info:
+                        fun_call_info[called_id] = set()
+                    fun_call_info[called_id].add(caller_id)
   
                     
     all_def_funciton_nodes =  find_nodes_by_type(tree.root_node, "preproc_function_def")
@@ -118,8 +178,9 @@ def parse_all_function_info(source_code, tree: tree_sitter.Tree):
         for sub_node in node.children:
             if sub_node.type == "identifier":
                 function_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
-                fun_info[function_name] = node
+                fun_info[sys.intern(function_name)] = node_span(node)
                 
+    fun_call_info = {called_id: array("i", sorted(caller_ids)) for called_id, caller_ids in fun_call_info.items()}
     return fun_info, fun_call_info
 
 def parse_all_type_info(source_code, tree: tree_sitter.Tree):
@@ -133,11 +194,11 @@ def parse_all_type_info(source_code, tree: tree_sitter.Tree):
             for sub_node in node.children:
                 if sub_node.type == "type_identifier":
                     type_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
-                    type_info[type_name] = node
+                    type_info[sys.intern(type_name)] = node_span(node)
         if node.child_by_field_name('type') and node.child_by_field_name('declarator') and node.child_by_field_name('declarator').type == 'type_identifier':  
             sub_node = node.child_by_field_name('declarator')   
             type_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
-            type_info[type_name] = node                                
+            type_info[sys.intern(type_name)] = node_span(node)                                
     return type_info
 
 def parse_all_define_info(source_code, tree: tree_sitter.Tree):
@@ -147,101 +208,159 @@ def parse_all_define_info(source_code, tree: tree_sitter.Tree):
         for sub_node in node.children:
             if sub_node.type == "identifier":
                 type_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
-                define_info[type_name] = node
+                define_info[sys.intern(type_name)] = node_span(node)
                                 
     return define_info
 
 ############# Init
-def init(project_path):
+def is_source_file(file_name: str) -> bool:
+    return file_name.endswith(".c") or file_name.endswith(".h") or file_name.endswith(".cpp") or file_name.endswith(".hpp")
+
+def extract_symbols(source_code, tree: tree_sitter.Tree):
+    """Return the per-kind symbol tables of one file, as stored in project_data."""
+    functions, function_calls = parse_all_function_info(source_code, tree)
+    return {
+        "functions": functions,
+        "function_calls": function_calls,
+        "types": parse_all_type_info(source_code, tree),
+        "defines": parse_all_define_info(source_code, tree)
+    }
+
+def store_symbols(data, file_path, symbols):
+    for kind, table in symbols.items():
+        data[kind][file_path] = table
 
-    for root, dirs, files in os.walk(project_path):
+def index_file(data, file_path, trees=None):
+    file_path = index_path(file_path)
+    c_file_content = read_source(file_path)
+    tree = get_parser().parse(c_file_content)
+    store_symbols(data, file_path, extract_symbols(c_file_content, tree))
+    # Only spans survive extraction, so the parse tree is freed unless the
+    # caller keeps it for incremental reparsing
+    if trees is not None:
+        trees[file_path] = tree
+
+def build_index(project_path, data=None, trees=None):
+    if data is None:
+        data = new_project_data()
+
+    for root, dirs, files in os.walk(index_path(project_path)):
         for file in files:
-            if not (file.endswith(".c") or file.endswith(".h") or file.endswith(".cpp") or file.endswith(".hpp")):
+            if not is_source_file(file):
                 continue
+            index_file(data, os.path.join(root, file), trees)
+    return data
+
+def remove_file(data, file_path, trees=None):
+    file_path = index_path(file_path)
+    for kind in data.values():
+        kind.pop(file_path, None)
+    source_buffers.pop(file_path, None)
+    if trees is not None:
+        trees.pop(file_path, None)
 
-            file_path = os.path.join(root, file)
-            with open(file_path, "rb") as c_file:
-                c_file_content = c_file.read()
-                tree = parser.parse(c_file_content)
+def refresh_file(data, file_path, trees=None):
+    """Re-index one file after it was edited, added or deleted."""
+    file_path = index_path(file_path)
+    remove_file(data, file_path, trees)
+    if os.path.isfile(file_path) and is_source_file(file_path):
+        index_file(data, file_path, trees)
 
-            project_data["functions"][file_path], project_data["function_calls"][file_path] = parse_all_function_info(c_file_content, tree)
-            project_data["types"][file_path] = parse_all_type_info(c_file_content, tree)
-            project_data["defines"][file_path] = parse_all_define_info(c_file_content, tree)
+def init(project_path, trees=None):
+    build_index(project_path, project_data, trees)
+
+def use_index(data):
+    """Make the query functions answer from another project's index."""
+    global project_data
+    project_data = data
 
 ############# Query
+def get_prefer_path() -> str:
+    # Index keys are absolute, so match them against the absolute folder
+    return os.path.join(index_path(get_config().prefer_path), "")
+
 def query_function(function_name: str) -> str:
+    prefer_path = get_prefer_path()
     file_to_fundef = project_data["functions"]
 
     for file_path, fun_info in file_to_fundef.items():
         if prefer_path in file_path and function_name in fun_info:
-            node = fun_info[function_name]
-            with open(file_path, "rb") as f:
-                source_code = f.read()
-            return source_code[node.start_byte:node.end_byte].decode("utf8")
+            span = fun_info[function_name]
+            source_code = read_source(file_path)
+            return source_code[span.start_byte:span.end_byte].decode("utf8")
         
     for file_path, fun_info in file_to_fundef.items():
         if prefer_path not in file_path and function_name in fun_info:
-            node = fun_info[function_name]
-            with open(file_path, "rb") as f:
-                source_code = f.read()
-            return source_code[node.start_byte:node.end_byte].decode("utf8")            
+            span = fun_info[function_name]
+            source_code = read_source(file_path)
+            return source_code[span.start_byte:span.end_byte].decode("utf8")            
+
+def query_function_in_file(function_name: str, file_path: str) -> str:
+    """Return the definition of a function from one given file, ignoring prefer_path."""
+    fun_info = project_data["functions"].get(index_path(file_path), {})
+    if function_name in fun_info:
+        span = fun_info[function_name]
+        source_code = read_source(index_path(file_path))
+        return source_code[span.start_byte:span.end_byte].decode("utf8")
 
 def query_caller(function_name: str) -> str:
+    prefer_path = get_prefer_path()
     file_to_fun_call = project_data["function_calls"]
 
     caller_set = set()
+    function_id = symbol_ids.get(function_name)
+    if function_id is None:
+        return ""
     # First pass: prefer matching files
     for file_path, fun_calls in file_to_fun_call.items():
-        if prefer_path in file_path and function_name in fun_calls:
-            caller_set.update(fun_calls[function_name])
+        if prefer_path in file_path and function_id in fun_calls:
+            caller_set.update(fun_calls[function_id])
    
      # Second pass: fallback to other files
     if not caller_set:
         for file_path, fun_calls in file_to_fun_call.items():
-            if prefer_path not in file_path and function_name in fun_calls:
-                caller_set.update(fun_calls[function_name])
+            if prefer_path not in file_path and function_id in fun_calls:
+                caller_set.update(fun_calls[function_id])
     
      # Now extract source code for all caller functions
     
     code = ""
-    for caller in caller_set:
-        code += query_function(caller).strip() + "\n"
+    for caller_id in caller_set:
+        code += query_function(symbol_names[caller_id]).strip() + "\n"
       
     return code
 
 def query_type(type_name: str) -> str:
+    prefer_path = get_prefer_path()
     file_to_typedef = project_data["types"]
 
     for file_path, type_info in file_to_typedef.items():
         if prefer_path in file_path and type_name in type_info:
-            node = type_info[type_name]
-            with open(file_path, "rb") as f:
-                source_code = f.read()
-            return source_code[node.start_byte:node.end_byte].decode("utf8")
+            span = type_info[type_name]
+            source_code = read_source(file_path)
+            return source_code[span.start_byte:span.end_byte].decode("utf8")
     
     for file_path, type_info in file_to_typedef.items():
         if prefer_path not in file_path and type_name in type_info:     
-            node = type_info[type_name]
-            with open(file_path, "rb") as f:
-                source_code = f.read()
-            return source_code[node.start_byte:node.end_byte].decode("utf8")
+            span = type_info[type_name]
+            source_code = read_source(file_path)
+            return source_code[span.start_byte:span.end_byte].decode("utf8")
             
 def query_def(def_name:str) -> str:
+    prefer_path = get_prefer_path()
     file_to_def = project_data["defines"]
 
     for file_path, define_info in file_to_def.items():
         if prefer_path in file_path and def_name in define_info:
-            node = define_info[def_name]
-            with open(file_path, "rb") as f:
-                source_code = f.read()
-            return source_code[node.start_byte:node.end_byte].decode("utf8")
+            span = define_info[def_name]
+            source_code = read_source(file_path)
+            return source_code[span.start_byte:span.end_byte].decode("utf8")
         
     for file_path, define_info in file_to_def.items():
         if prefer_path not in file_path and def_name in define_info:
-            node = define_info[def_name]
-            with open(file_path, "rb") as f:
-                source_code = f.read()
-            return source_code[node.start_byte:node.end_byte].decode("utf8")
+            span = define_info[def_name]
+            source_code = read_source(file_path)
+            return source_code[span.start_byte:span.end_byte].decode("utf8")
         
 def query_name(name:str) -> str:
     fun = query_function(name)
@@ -256,4 +375,14 @@ def query_name(name:str) -> str:
         return type
     else:
         return query_def(name)
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    # Index the configured project and print the definitions of the given names,
+    # or just report the index size when no name is given.
+    config = get_config()
+    init(config.project_path)
+    if len(sys.argv) > 1:
+        for name in sys.argv[1:]:
+            print(query_name(name))
+    else:
+        print(f"Indexed {len(project_data['functions'])} files, {len(symbol_names)} symbol names")
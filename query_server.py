@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import socket
+import socketserver
+import threading
+import time
+import query_repo_recursive
+from query_repo_recursive import init, refresh_file, is_source_file, index_path, query_name, query_caller, query_function, query_function_in_file, query_type, query_def
+from incremental import update_index
+from init import get_config, setup_logging
+
+# === Symbol-query server ===
+# Holds one warm index and its source buffers, and answers batched lookups
+# from any number of analysis workers over a Unix socket. Messages are
+# newline-delimited JSON:
+#   {"op": "query", "queries": [{"tool": "query_name", "args": {"name": "foo"}}]}
+#   {"op": "refresh", "files": ["/path/to/file.c"]}
+#   {"op": "update", "rev_range": "HEAD~1..HEAD"}
+#   {"op": "stats"}
+
+SERVER_TOOLS = {
+    "query_name": query_name,
+    "query_caller": query_caller,
+    "query_function": query_function,
+    "query_function_in_file": query_function_in_file,
+    "query_type": query_type,
+    "query_def": query_def,
+}
+
+# Serialises queries with index refreshes; lookups only hold it for microseconds
+index_lock = threading.Lock()
+
+# Parse trees of the indexed files, kept when query_retain_trees is set so
+# that updates from git diffs can reparse incrementally
+retained_trees = None
+
+def run_query(query):
+    tool = SERVER_TOOLS.get(query.get("tool"))
+    if tool is None:
+        return {"error": f"unknown tool {query.get('tool')}"}
+    try:
+        return {"result": tool(**query.get("args", {}))}
+    except Exception as e:
+        return {"error": str(e)}
+
+def handle_request(request):
+    op = request.get("op")
+    if op == "query":
+        with index_lock:
+            return {"results": [run_query(query) for query in request.get("queries", [])]}
+    elif op == "refresh":
+        files = request.get("files", [])
+        with index_lock:
+            for file_path in files:
+                refresh_file(query_repo_recursive.project_data, file_path, retained_trees)
+        print(f"🔄 Refreshed {len(files)} files")
+        return {"refreshed": len(files)}
+    elif op == "update":
+        with index_lock:
+            try:
+                changes = update_index(get_config().project_path, request["rev_range"], query_repo_recursive.project_data, retained_trees)
+            except Exception as e:
+                return {"error": str(e)}
+        print(f"🔄 Updated {sum(len(files) for files in changes['files'].values())} files from {request['rev_range']}")
+        return {"changes": changes}
+    elif op == "stats":
+        with index_lock:
+            return {
+                "files": len(query_repo_recursive.project_data["functions"]),
+                "symbols": len(query_repo_recursive.symbol_names)
+            }
+    return {"error": f"unknown op {op}"}
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if isinstance(request, dict):
+                    response = handle_request(request)
+                else:
+                    response = {"error": "invalid request: expected a JSON object"}
+            except json.JSONDecodeError as e:
+                response = {"error": f"invalid request: {e}"}
+            except Exception as e:
+                # Answer instead of dropping the connection, as run_query does
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf8") + b"\n")
+            self.wfile.flush()
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def scan_mtimes(project_path):
+    mtimes = {}
+    for root, dirs, files in os.walk(index_path(project_path)):
+        for file in files:
+            if not is_source_file(file):
+                continue
+            file_path = os.path.join(root, file)
+            try:
+                mtimes[file_path] = os.stat(file_path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+    return mtimes
+
+def watch_project(project_path, interval):
+    """Poll the project tree and refresh files that were edited, added or deleted."""
+    known = scan_mtimes(project_path)
+    while True:
+        time.sleep(interval)
+        current = scan_mtimes(project_path)
+        changed = [path for path, mtime in current.items() if known.get(path) != mtime]
+        changed.extend(path for path in known if path not in current)
+        if changed:
+            handle_request({"op": "refresh", "files": changed})
+        known = current
+
+def server_running(socket_path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+def serve(config):
+    global retained_trees
+    socket_path = config.query_socket
+    if os.path.exists(socket_path):
+        if server_running(socket_path):
+            print(f"❌ A query server is already serving on {socket_path}")
+            sys.exit(1)
+        # Left behind by a server that did not shut down cleanly
+        os.remove(socket_path)
+
+    if config.query_retain_trees:
+        retained_trees = {}
+    print("Start scanning project...")
+    init(config.project_path, retained_trees)
+    print("Finish scanning project...")
+
+    if config.query_watch_interval:
+        threading.Thread(target=watch_project, args=(config.project_path, config.query_watch_interval), daemon=True).start()
+
+    with QueryServer(socket_path, QueryHandler) as server:
+        print(f"🛰️ Serving symbol queries on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socket_path)
+
+# === Client ===
+class QueryClient:
+    """Connection to a running query server, reused for every call of this process."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.lock = threading.Lock()
+        self.sock = None
+        self.reader = None
+        self.pid = None
+
+    def connect(self):
+        # Forked workers must not share their parent's connection
+        self.pid = os.getpid()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(self.socket_path)
+        except OSError:
+            self.close()
+            raise
+        self.reader = self.sock.makefile("rb")
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    def request(self, request):
+        with self.lock:
+            if self.sock is None or self.pid != os.getpid():
+                self.connect()
+            try:
+                self.sock.sendall(json.dumps(request).encode("utf8") + b"\n")
+                line = self.reader.readline()
+                if not line:
+                    raise ConnectionError(f"Query server at {self.socket_path} closed the connection")
+            except OSError:
+                # Drop the dead connection so the next request reconnects, e.g. after a server restart
+                self.close()
+                raise
+        return json.loads(line)
+
+    def batch(self, queries):
+        """Run several lookups in one round trip; each query is {"tool": ..., "args": {...}}."""
+        return self.request({"op": "query", "queries": queries})["results"]
+
+    def call(self, tool, **args):
+        result = self.batch([{"tool": tool, "args": args}])[0]
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result["result"]
+
+    def refresh(self, files):
+        return self.request({"op": "refresh", "files": files})
+
+    def update(self, rev_range):
+        return self.request({"op": "update", "rev_range": rev_range})
+
+def remote_tools(client):
+    """Drop-in replacements for the in-process lookup tools, with the same signatures."""
+    def query_function(function_name: str) -> str:
+        return client.call("query_function", function_name=function_name)
+
+    def query_function_in_file(function_name: str, file_path: str) -> str:
+        return client.call("query_function_in_file", function_name=function_name, file_path=file_path)
+
+    def query_name(name: str) -> str:
+        return client.call("query_name", name=name)
+
+    def query_caller(function_name: str) -> str:
+        return client.call("query_caller", function_name=function_name)
+
+    return {
+        "query_function": query_function,
+        "query_function_in_file": query_function_in_file,
+        "query_name": query_name,
+        "query_caller": query_caller,
+    }
+
+clients = {}
+
+def get_client(socket_path):
+    if socket_path not in clients:
+        clients[socket_path] = QueryClient(socket_path)
+    return clients[socket_path]
+
+if __name__ == "__main__":
+    config = get_config()
+    if len(sys.argv) > 2 and sys.argv[1] == "refresh":
+        # Notify a running server that files were edited
+        print(get_client(config.query_socket).refresh([os.path.abspath(path) for path in sys.argv[2:]]))
+    elif len(sys.argv) == 3 and sys.argv[1] == "update":
+        # Re-index the files touched in a git revision range
+        print(json.dumps(get_client(config.query_socket).update(sys.argv[2]), indent=2))
+    else:
+        setup_logging(config)
+        serve(config)
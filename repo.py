@@ -1,10 +1,15 @@
+from __future__ import annotations
 import os
+import sys
 import json
-import tree_sitter
-from tree_sitter import Language, Parser
-from query_repo_recursive import find_nodes_by_type, find_first_node_by_type, find_first_father_by_type, parser
+from typing import TYPE_CHECKING
+from query_repo_recursive import find_nodes_by_type, find_first_node_by_type, find_first_father_by_type, get_parser
+from incremental import update_index, parse_rev_range, read_revision
 from init import *
 
+if TYPE_CHECKING:
+    import tree_sitter
+
 def generate_function_summary(code: str) -> dict:
     prompt = f"""Analyze the following C function and return:
 A one-sentence summary of what it does.
@@ -33,11 +38,20 @@ Write a paragraph summary of this file based on the above functions.
 """
     return askLLM(file_prompt).strip()
 
-def get_function_summaries(source_code, tree: tree_sitter.Tree):
+def get_function_summaries(source_code, tree: tree_sitter.Tree, reuse=None):
+    """
+    Summarize every function of a file.
+    :param reuse: maps function name -> existing summary for functions known to be unchanged
+    """
     function_map = {}
     
     def extract_text(node):
         return source_code[node.start_byte:node.end_byte].decode("utf8")
+
+    def summarize(function_name, func_node):
+        if reuse and function_name in reuse:
+            return reuse[function_name]
+        return generate_function_summary(extract_text(func_node))
     
     all_function_nodes = find_nodes_by_type(tree.root_node, "function_definition")
     for func_node in all_function_nodes:
@@ -46,7 +60,7 @@ def get_function_summaries(source_code, tree: tree_sitter.Tree):
             for sub_node in dec_node.children:
                 if sub_node.type in {"qualified_identifier", "scoped_identifier", "identifier"}:
                     function_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
-                    summary = generate_function_summary(extract_text(func_node))
+                    summary = summarize(function_name, func_node)
                     function_map[function_name] = {
                         "start_byte": func_node.start_byte,
                         "end_byte": func_node.end_byte,
@@ -60,7 +74,7 @@ def get_function_summaries(source_code, tree: tree_sitter.Tree):
                         if class_name:
                             class_name = source_code[class_name.start_byte:class_name.end_byte].decode("utf8")
                             function_name = f"{class_name}::{function_name}"
-                    summary = generate_function_summary(extract_text(func_node))
+                    summary = summarize(function_name, func_node)
                     function_map[function_name] = {
                         "start_byte": func_node.start_byte,
                         "end_byte": func_node.end_byte,
@@ -73,7 +87,7 @@ def get_function_summaries(source_code, tree: tree_sitter.Tree):
         for sub_node in func_node.children:
             if sub_node.type == "identifier":
                 function_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8")
-                summary = generate_function_summary(extract_text(func_node))
+                summary = summarize(function_name, func_node)
                 function_map[function_name] = {
                         "start_byte": func_node.start_byte,
                         "end_byte": func_node.end_byte,
@@ -108,7 +122,7 @@ def summarize_directory(directory: str, module_name=None) -> dict:
             print(f"📄 Processing file: {entry}")
             with open(full_path, "rb") as f:
                 content = f.read()
-            tree = parser.parse(content)
+            tree = get_parser().parse(content)
 
             function_list = get_function_summaries(content, tree)
 
@@ -121,22 +135,113 @@ def summarize_directory(directory: str, module_name=None) -> dict:
                 all_file_summaries.append(f"{entry}: {file_summary}")
 
     # 🧠 Generate summary of this folder (file or module)
+    folder_summary["summary"] = generate_folder_summary(directory, all_file_summaries)
+
+    return folder_summary
+
+def generate_folder_summary(directory: str, all_file_summaries: list) -> str:
     prompt = f"""Here are the summaries of items in the folder "{os.path.basename(directory)}":
 
 {chr(10).join(f"- {s}" for s in all_file_summaries)}
 
 Write a 1-2 sentence summary of this folder's purpose based on its contents.
 """
-    folder_summary["summary"] = askLLM(prompt).strip()
-
-    return folder_summary
+    return askLLM(prompt).strip()
+
+# === Targeted re-summarization from a change set (see incremental.update_index) ===
+def read_working_tree(file_path):
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, "rb") as f:
+        return f.read()
+
+def update_summary(summary: dict, changes: dict, directory: str, read_content=read_working_tree) -> dict:
+    """
+    Update a summary tree in place after the given code changes. Only added or
+    changed functions get new summaries; the summaries of the touched files and
+    of the folders above them are regenerated.
+    :param read_content: returns the new content of a changed file, or None if it was deleted
+    """
+    regenerate = {(change["file"], change["name"]) for change in changes["functions"]["added"] + changes["functions"]["changed"]}
+    dirty_folders = {}
+
+    for file_path in changes["files"]["added"] + changes["files"]["modified"] + changes["files"]["removed"]:
+        relpath = os.path.relpath(file_path, directory)
+        if relpath.startswith(".."):
+            continue
+        parts = relpath.split(os.sep)
+
+        # 📁 Find (or create) the folder nodes down to the file
+        folder = summary
+        folder_path = directory
+        chain = [(folder_path, folder)]
+        for part in parts[:-1]:
+            folder = folder["files"].setdefault(part, {"summary": "", "files": {}})
+            folder_path = os.path.join(folder_path, part)
+            chain.append((folder_path, folder))
+        entry = parts[-1]
+        previous = folder["files"].get(entry)
+
+        # 📄 Re-summarize the file, reusing summaries of unchanged functions
+        function_list = {}
+        content = read_content(file_path)
+        if content is not None:
+            print(f"📄 Updating file: {relpath}")
+            tree = get_parser().parse(content)
+            previous_functions = previous.get("functions", {}) if previous else {}
+            reuse = {name: info["summary"] for name, info in previous_functions.items() if (file_path, name) not in regenerate}
+            function_list = get_function_summaries(content, tree, reuse)
+
+        if function_list:
+            functions_changed = (
+                previous is None
+                or list(function_list) != list(previous["functions"])
+                or any(function_list[name]["summary"] != previous["functions"][name]["summary"] for name in function_list)
+            )
+            folder["files"][entry] = {
+                "summary": generate_file_summary(function_list) if functions_changed else previous["summary"],
+                "functions": function_list
+            }
+        elif previous is not None:
+            del folder["files"][entry]
+            functions_changed = True
+        else:
+            functions_changed = False
+
+        if functions_changed:
+            for path, node in chain:
+                dirty_folders[path] = node
+
+    # 🧠 Regenerate folder summaries bottom-up
+    for folder_path in sorted(dirty_folders, key=lambda path: path.count(os.sep), reverse=True):
+        folder = dirty_folders[folder_path]
+        all_file_summaries = [
+            f"{entry}/: {item['summary']}" if "files" in item else f"{entry}: {item['summary']}"
+            for entry, item in folder["files"].items()
+        ]
+        folder["summary"] = generate_folder_summary(folder_path, all_file_summaries)
+
+    return summary
 
 if __name__ == "__main__":
-    print(f"📂 Starting summarization for directory: {prefer_path}")
-    results = summarize_directory(prefer_path)
+    config = get_config()
+    setup_logging(config)
+    if len(sys.argv) == 3 and sys.argv[1] == "--update":
+        # Re-summarize only what changed in a git revision range, e.g. HEAD~1..HEAD
+        print(f"📂 Updating summary for changes in {sys.argv[2]}")
+        changes = update_index(config.project_path, sys.argv[2])
+        # Summarize the files as of the end of the range; only "A" alone means the working tree
+        new_rev = parse_rev_range(sys.argv[2])[1]
+        def read_content(file_path):
+            return read_revision(config.project_path, new_rev, os.path.relpath(file_path, config.project_path))
+        with open(config.summary_json) as f:
+            results = update_summary(json.load(f), changes, config.prefer_path, read_content)
+    else:
+        print(f"📂 Starting summarization for directory: {config.prefer_path}")
+        results = summarize_directory(config.prefer_path)
 
     # Optionally write to JSON for LLM input
-    with open(summary_json, "w") as out:
+    with open(config.summary_json, "w") as out:
         json.dump(results, out, indent=2)
 
   
\ No newline at end of file
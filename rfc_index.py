@@ -0,0 +1,108 @@
+import os
+import re
+import json
+import hashlib
+
+# === Streaming RFC ingestion ===
+# RFC files are cleaned and split into sections line by line, so memory holds
+# at most one section at a time. Every section gets a stable ID and a hash,
+# and the section index only stores byte offsets into the cleaned file; the
+# text is loaded on demand.
+
+header_pattern = re.compile(r'RFC (\d+)\s+(.*?)\s+([A-Za-z]+ \d{4})')
+footer_pattern = re.compile(r'^.*\s+\[Page \d+\]$')
+# Adjusted regex pattern to capture section numbers more reliably, including standalone section titles
+section_header_pattern = re.compile(r'^(\d+(?:\.\d+)*)(\.?)\s+(.*)$')
+
+def clean_lines(file):
+    """Yield the lines of an RFC without page headers, footers or blank lines."""
+    first = True
+    for line in file:
+        line = line.rstrip("\n")
+        line = header_pattern.sub('', line)
+        line = footer_pattern.sub('', line)
+        if not line.strip():
+            continue
+        if first:
+            line = line.lstrip()
+            first = False
+        yield line
+
+def section_text(number, title, content):
+    return number + title + '\n' + content
+
+def finish_section(section, lines, end):
+    content = "\n".join(lines).strip()
+    section["end"] = end
+    section["hash"] = hashlib.sha256(section_text(section["number"], section["title"], content).encode("utf8")).hexdigest()
+    return section
+
+def handle_doc(readfiles, writefile, indexfile=None):
+    """
+    Clean the given RFC files into writefile and segment them into sections.
+    Returns the section index: one record per section with its ID, hash and
+    byte offsets into writefile. The index is also saved to indexfile if given.
+    """
+    if isinstance(readfiles, str):
+        readfiles = [readfiles]
+
+    sections = []
+    seen_ids = {}
+    offset = 0
+
+    with open(writefile, 'wb') as cleaned_file:
+        for readfile in readfiles:
+            rfc_name = os.path.splitext(os.path.basename(readfile))[0]
+            current = None
+            lines = []
+
+            with open(readfile, 'r', encoding='utf-8') as file:
+                for line in clean_lines(file):
+                    data = (line + "\n").encode("utf8")
+                    match = section_header_pattern.match(line)
+                    if match:
+                        if current is not None:
+                            sections.append(finish_section(current, lines, offset))
+                        # step 2: segmentation to sections, keyed by RFC name and section number
+                        section_id = f"{rfc_name}:{match.group(1)}"
+                        seen_ids[section_id] = seen_ids.get(section_id, 0) + 1
+                        if seen_ids[section_id] > 1:
+                            section_id += f"#{seen_ids[section_id]}"
+                        current = {
+                            "id": section_id,
+                            "rfc": rfc_name,
+                            "number": match.group(1),
+                            "title": match.group(3).strip(),
+                            "file": writefile,
+                            "offset": offset,
+                            "content_offset": offset + len(data)
+                        }
+                        lines = []
+                    elif current is not None:
+                        lines.append(line)
+                    # step 1: clean document
+                    cleaned_file.write(data)
+                    offset += len(data)
+
+            if current is not None:
+                sections.append(finish_section(current, lines, offset))
+
+    print(f"Cleaned content written to {writefile}")
+
+    if indexfile:
+        with open(indexfile, 'w', encoding='utf-8') as f:
+            json.dump(sections, f, indent=2)
+        print(f"Section index written to {indexfile}")
+
+    return sections
+
+def load_section_index(indexfile):
+    with open(indexfile, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_section_text(section):
+    """Read the text of one indexed section back from the cleaned file."""
+    with open(section["file"], 'rb') as f:
+        f.seek(section["content_offset"])
+        content = f.read(section["end"] - section["content_offset"]).decode("utf8")
+    return section_text(section["number"], section["title"], content.strip())
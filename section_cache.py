@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+
+# === Section-level result cache ===
+# Each RFC section is stored under the hash of its text, together with the
+# digest of every code snippet the agents read while analysing it. A cached
+# verdict is reused only if replaying those reads still yields the same code.
+
+def digest(text) -> str:
+    if text is None:
+        text = ""
+    if isinstance(text, str):
+        text = text.encode("utf8")
+    return hashlib.sha256(text).hexdigest()
+
+def load_section_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_section_cache(path, cache):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+def tool_output(result) -> str:
+    # The text the agents see for a tool result; autogen formats it with str()
+    return str(result)
+
+def make_read(tool, args, content):
+    """
+    Record one code read: the tool used, its arguments and the digest of what it returned.
+    :param content: the tool output exactly as the agents saw it
+    """
+    return {"tool": tool, "args": args, "digest": digest(tool_output(content))}
+
+def lookup_section(cache, section_hash, tools):
+    """
+    Return the cached result for this section, or None if the section is unknown
+    or any snippet read during its analysis has changed.
+    :param section_hash: digest of the section text, as stored in the section index
+    :param tools: maps tool name -> callable used to replay a recorded read
+    """
+    entry = cache.get(section_hash)
+    if not entry:
+        return None
+    for read in entry["reads"]:
+        tool = tools.get(read["tool"])
+        if tool is None:
+            return None
+        try:
+            content = tool(**read["args"])
+        except Exception:
+            return None
+        if digest(tool_output(content)) != read["digest"]:
+            return None
+    return entry["result"]
+
+def record_section(cache, section_hash, reads, result):
+    cache[section_hash] = {
+        "reads": reads,
+        "result": result
+    }
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import zlib
+import hashlib
+
+# === Content-addressed snippet store ===
+# Code returned by tool calls is stored once, zlib-compressed, under the hash
+# of its text. Reports reference snippets as "sha256:<hex>" instead of
+# repeating the same function bodies in every entry.
+
+REF_PREFIX = "sha256:"
+
+def snippet_path(store_dir, ref):
+    key = ref[len(REF_PREFIX):]
+    return os.path.join(store_dir, key[:2], key + ".zz")
+
+def store_snippet(store_dir, text: str) -> str:
+    """Store a snippet if it is not stored yet and return its reference."""
+    data = text.encode("utf8")
+    ref = REF_PREFIX + hashlib.sha256(data).hexdigest()
+    path = snippet_path(store_dir, ref)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(data))
+        os.replace(tmp_path, path)
+    return ref
+
+def load_snippet(store_dir, ref) -> str:
+    with open(snippet_path(store_dir, ref), "rb") as f:
+        return zlib.decompress(f.read()).decode("utf8")
+
+def expand_context(store_dir, context) -> str:
+    """Turn a list of snippet references back into the concatenated text."""
+    if isinstance(context, str):
+        # Reports written before the snippet store hold the text itself
+        return context
+    return "".join(load_snippet(store_dir, ref) + '\n\n' for ref in context)
+
+def load_report(report_file, store_dir, expand=True):
+    """Load an inconsistency report, replacing snippet references with their text if expand is set."""
+    with open(report_file, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if expand:
+        for entry in entries:
+            entry["additional context"] = expand_context(store_dir, entry.get("additional context", []))
+    return entries
+
+if __name__ == "__main__":
+    # Print a report with every snippet reference expanded
+    from init import get_config
+    if len(sys.argv) != 2:
+        print("Usage: python snippet_store.py inconsistencies_{protocol}.json")
+        sys.exit(1)
+    print(json.dumps(load_report(sys.argv[1], get_config().snippet_store), indent=2))